@@ -2,6 +2,8 @@ import streamlit as st
 import os
 import tempfile
 from core.rag_pipeline import RagPipeline
+from core.config import settings
+from core.conversation import ConversationState
 
 # --- Page Config ---
 st.set_page_config(
@@ -19,11 +21,16 @@ def get_pipeline():
 def initialize_session_state():
     if "messages" not in st.session_state:
         st.session_state.messages = []
+    if "conversation" not in st.session_state:
+        # Tóm tắt hội thoại + ngữ cảnh đã truy xuất, dùng lại cho câu hỏi nối tiếp
+        st.session_state.conversation = ConversationState()
     if "pipeline" not in st.session_state:
         st.session_state.pipeline = get_pipeline()
+    if "tenant" not in st.session_state:
+        st.session_state.tenant = settings.default_tenant
     if "processed_files" not in st.session_state:
-        # Lấy danh sách tài liệu đã có sẵn từ Qdrant để hiến thị
-        docs = st.session_state.pipeline.vdb.get_all_documents()
+        # Lấy danh sách tài liệu đã có sẵn từ Qdrant để hiến thị (chỉ của tenant hiện tại)
+        docs = st.session_state.pipeline.vdb.get_all_documents(tenant=st.session_state.tenant)
         st.session_state.processed_files = docs
 
 initialize_session_state()
@@ -41,6 +48,21 @@ st.markdown("""
 
 # --- Sidebar ---
 with st.sidebar:
+    tenant = st.text_input("Tenant", value=st.session_state.tenant, help="Mỗi tenant có kho tài liệu riêng")
+    try:
+        tenant = st.session_state.pipeline.vdb.resolve_tenant(tenant.strip())
+    except ValueError:
+        # Giữ tenant hiện tại, không để lỗi xảy ra giữa lúc OCR hoặc hỏi đáp
+        st.error(f"Tenant không hợp lệ: '{tenant}'. Chỉ dùng chữ, số, '_' hoặc '-' (tối đa 64 ký tự). Vẫn đang dùng '{st.session_state.tenant}'.")
+        tenant = st.session_state.tenant
+    if tenant != st.session_state.tenant:
+        # Đổi tenant: tải lại danh mục tài liệu và xóa lịch sử chat
+        st.session_state.tenant = tenant
+        st.session_state.processed_files = st.session_state.pipeline.vdb.get_all_documents(tenant=tenant)
+        st.session_state.messages = []
+        st.session_state.conversation.reset()
+        st.rerun()
+
     st.title("📂 Upload Documents")
     st.markdown("hỗ trợ định dạng PDF, PNG, JPG, JPEG.")
     
@@ -48,14 +70,14 @@ with st.sidebar:
     
     if st.button("Process Document", type="primary"):
         if uploaded_file is not None:
-            # Save uploaded file permanently to view later
-            os.makedirs("data/uploaded_docs", exist_ok=True)
-            save_path = os.path.join("data/uploaded_docs", uploaded_file.name)
+            # Save uploaded file permanently to view later (thư mục riêng của tenant)
+            save_path = st.session_state.pipeline.upload_path(uploaded_file.name, tenant=st.session_state.tenant)
+            os.makedirs(os.path.dirname(save_path), exist_ok=True)
             with open(save_path, "wb") as f:
                 f.write(uploaded_file.getbuffer())
                 
             # Kiểm tra xem file đã có trong DB chưa (trên giao diện cache hoặc quét Qdrant trực tiếp)
-            if uploaded_file.name in st.session_state.processed_files or st.session_state.pipeline.vdb.has_document(uploaded_file.name):
+            if uploaded_file.name in st.session_state.processed_files or st.session_state.pipeline.vdb.has_document(uploaded_file.name, tenant=st.session_state.tenant):
                 st.warning(f"Tài liệu '{uploaded_file.name}' đã có sẵn trong cơ sở dữ liệu! Bạn có thể đặt câu hỏi hoặc xem tài liệu ngay.")
                 if uploaded_file.name not in st.session_state.processed_files:
                     st.session_state.processed_files.append(uploaded_file.name)
@@ -64,7 +86,8 @@ with st.sidebar:
                     # Run Ingestion Pipeline
                     success = st.session_state.pipeline.ingest_document(
                         file_path=save_path, 
-                        source_name=uploaded_file.name
+                        source_name=uploaded_file.name,
+                        tenant=st.session_state.tenant
                     )
                     
                     if success:
@@ -84,15 +107,9 @@ with st.sidebar:
                 st.markdown(f"📄 `{file}`")
             with col2:
                 if st.button("❌", key=f"del_{file}", help="Xóa tài liệu"):
-                    # Xóa vector từ Qdrant
-                    st.session_state.pipeline.vdb.delete_document(file)
+                    # Xóa vector từ Qdrant và file vật lý của tenant hiện tại
+                    st.session_state.pipeline.delete_document(file, tenant=st.session_state.tenant)
                     st.session_state.processed_files.remove(file)
-                    # Xóa file vật lý
-                    try:
-                        os.remove(os.path.join("data", "uploaded_docs", file))
-                        os.remove(os.path.join("data", "ocr_results", f"{file}.txt"))
-                    except:
-                        pass
                     st.rerun()
     else:
         st.markdown("*Chưa có tài liệu nào*")
@@ -119,7 +136,12 @@ with tab1:
         # Generate assistant response
         with st.chat_message("assistant"):
             with st.spinner("Đang tìm kiếm thông tin và suy nghĩ..."):
-                response = st.session_state.pipeline.ask(prompt, allowed_sources=st.session_state.processed_files)
+                # Tenant routing already scopes the search to this tenant's documents
+                response = st.session_state.pipeline.ask_conversational(
+                    prompt,
+                    st.session_state.conversation,
+                    tenant=st.session_state.tenant
+                )
                 st.markdown(response)
                 
         st.session_state.messages.append({"role": "assistant", "content": response})
@@ -135,7 +157,7 @@ with tab2:
             
             with col1:
                 st.subheader("Bản gốc")
-                doc_path = os.path.join("data", "uploaded_docs", selected_doc)
+                doc_path = st.session_state.pipeline.upload_path(selected_doc, tenant=st.session_state.tenant)
                 if os.path.exists(doc_path):
                     ext = os.path.splitext(doc_path)[1].lower()
                     if ext == ".pdf":
@@ -152,7 +174,7 @@ with tab2:
             
             with col2:
                 st.subheader("Kết quả OCR")
-                ocr_path = os.path.join("data", "ocr_results", f"{selected_doc}.txt")
+                ocr_path = st.session_state.pipeline.ocr_path(selected_doc, tenant=st.session_state.tenant)
                 if os.path.exists(ocr_path):
                     with open(ocr_path, "r", encoding="utf-8") as f:
                         ocr_text = f.read()
@@ -13,6 +13,14 @@ class Settings(BaseSettings):
     # Qdrant Database
     qdrant_url: str = Field(default="http://localhost:6333")
     qdrant_api_key: str = Field(default="")
+    qdrant_collection: str = Field(default="smart_doc_qa")
+
+    # Multi-tenancy: "payload" (shared collection, tenant_id index) or "collection" (one per tenant)
+    tenant_mode: str = Field(default="payload")
+    default_tenant: str = Field(default="default")
+
+    # Page/heading/table-aware chunking (adds page & section metadata; slower than the default splitter)
+    structure_aware_chunking: bool = Field(default=False)
 
     model_config = SettingsConfigDict(env_file=".env", env_file_encoding="utf-8")
 
@@ -0,0 +1,103 @@
+import math
+from typing import List, Dict, Any, Optional, Tuple
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate (~3 characters per token for mixed Vietnamese/English text)."""
+    return len(text) // 3 + 1
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Keep the start of text within max_tokens, cut at a word boundary."""
+    max_chars = max_tokens * 3
+    if len(text) <= max_chars:
+        return text
+    cut = text.rfind(" ", 0, max_chars)
+    return text[:cut if cut > 0 else max_chars].rstrip()
+
+
+def cosine_similarity(a: List[float], b: List[float]) -> float:
+    dot = sum(x * y for x, y in zip(a, b))
+    norm = math.sqrt(sum(x * x for x in a)) * math.sqrt(sum(y * y for y in b))
+    return dot / norm if norm else 0.0
+
+
+class ConversationState:
+    def __init__(
+        self,
+        summary_token_budget: int = 300,
+        history_token_budget: int = 1200,
+        query_token_budget: int = 150,
+        drift_threshold: float = 0.85,
+        min_recent_turns: int = 2,
+    ):
+        """
+        Per-conversation memory for RagPipeline.ask_conversational():
+        - a rolling summary of older turns, capped at summary_token_budget
+        - the most recent turns verbatim. Once they exceed history_token_budget,
+          older turns are folded into the summary until the rest fits in half the
+          budget (keeping at least min_recent_turns), so summarization runs every
+          few turns rather than on every one
+        - the chunks retrieved for the last search, reused while follow-up
+          queries stay within drift_threshold cosine similarity of that search
+        """
+        self.summary_token_budget = summary_token_budget
+        self.history_token_budget = history_token_budget
+        self.query_token_budget = query_token_budget
+        self.drift_threshold = drift_threshold
+        self.min_recent_turns = min_recent_turns
+
+        self.summary = ""
+        self.turns: List[Tuple[str, str]] = []
+        self._anchor_vector: Optional[List[float]] = None
+        self._scope = None
+        self._search_results: List[Dict[str, Any]] = []
+
+    def has_history(self) -> bool:
+        return bool(self.summary or self.turns)
+
+    def transcript(self, turns: Optional[List[Tuple[str, str]]] = None) -> str:
+        """Turns as text; long answers are clipped so even a single turn stays within budget."""
+        turns = self.turns if turns is None else turns
+        answer_budget = self.history_token_budget // 4
+        return "\n".join(
+            f"Người dùng: {truncate_to_tokens(user, self.query_token_budget)}\nTrợ lý: {truncate_to_tokens(assistant, answer_budget)}"
+            for user, assistant in turns
+        )
+
+    def add_turn(self, user: str, assistant: str):
+        self.turns.append((user, assistant))
+
+    def needs_compaction(self) -> bool:
+        return len(self.turns) > self.min_recent_turns and estimate_tokens(self.transcript()) > self.history_token_budget
+
+    def recent_turn_count(self) -> int:
+        """How many of the newest turns to keep verbatim when compacting: as many as fit in half the budget."""
+        keep = 0
+        tokens = 0
+        for turn in reversed(self.turns):
+            tokens += estimate_tokens(self.transcript([turn]))
+            if tokens > self.history_token_budget // 2:
+                break
+            keep += 1
+        return max(keep, self.min_recent_turns)
+
+    def cached_results(self, query_vector: List[float], scope: tuple) -> Optional[List[Dict[str, Any]]]:
+        """Chunks from the last search, or None if the scope changed or the query drifted too far."""
+        if self._anchor_vector is None or scope != self._scope:
+            return None
+        if cosine_similarity(query_vector, self._anchor_vector) < self.drift_threshold:
+            return None
+        return self._search_results
+
+    def remember_results(self, query_vector: List[float], scope: tuple, search_results: List[Dict[str, Any]]):
+        self._anchor_vector = query_vector
+        self._scope = scope
+        self._search_results = search_results
+
+    def reset(self):
+        self.summary = ""
+        self.turns = []
+        self._anchor_vector = None
+        self._scope = None
+        self._search_results = []
@@ -1,14 +1,48 @@
-from typing import List, Dict, Any
+import re
+import os
+import bisect
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Dict, Any, Optional, Tuple
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 
+# One pass over the text finds every element the chunker cares about: page
+# markers emitted by the OCR services ("--- Page 3 ---"), markdown heading lines
+# and runs of table rows. Anchoring on the newline (instead of ^ with MULTILINE)
+# keeps the scan in C between line breaks.
+_ELEMENT = (
+    r"(?:--- Page (?P<page>\d+) ---[ \t]*"
+    r"|[ \t]*(?:#{1,6}[ \t]+(?P<title>\S[^\n]*?)[ \t#]*"
+    r"|\|[^\n]*(?:\n[ \t]*\|[^\n]*)*))(?=\n|\Z)"
+)
+ELEMENT_RE = re.compile(r"\n" + _ELEMENT)
+ELEMENT_AT_START_RE = re.compile(_ELEMENT)
+NON_SPACE_RE = re.compile(r"\S")
+
+# Chunk boundaries in order of preference, with how many separator chars stay in the chunk
+SPLIT_SEPARATORS = (("\n\n", 0), ("\n", 0), (". ", 1), (" ", 0))
+
+# EXPERIMENTAL: automatic process pool gate for parse_and_chunk_files(). Only
+# measured on a 1-CPU box (scripts/bench_chunker.py): serial chunking ~12 ns/char;
+# pool overhead ~20 ms fixed plus ~7 ns/char (file reads and metadata pickling).
+# Assuming that overhead stays serial, the pool would pay off only with 4+ workers
+# and ~10M+ characters, so in practice the automatic pool almost never runs.
+# These values are a conservative placeholder until multi-core timings are taken;
+# pass max_workers explicitly to use the pool regardless.
+PARALLEL_MIN_CHARS = 10_000_000
+PARALLEL_MIN_WORKERS = 4
+
+
 class DocumentParser:
-    def __init__(self, chunk_size: int = 1000, chunk_overlap: int = 200):
+    def __init__(self, chunk_size: int = 1000, chunk_overlap: int = 200, structure_aware: bool = False):
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.structure_aware = structure_aware
         self.text_splitter = RecursiveCharacterTextSplitter(
             chunk_size=chunk_size,
             chunk_overlap=chunk_overlap,
             separators=["\n\n", "\n", " ", ""]
         )
-        
+
     def parse_and_chunk(self, raw_text: str, source_metadata: Dict[str, Any] = None) -> tuple[List[str], List[Dict[str, Any]]]:
         """
         Takes raw text extracted from OCR, splits it into chunks,
@@ -17,17 +51,208 @@ class DocumentParser:
         if not raw_text or not raw_text.strip():
             print("Warning: Received empty text for chunking.")
             return [], []
-            
-        chunks = self.text_splitter.split_text(raw_text)
-        
+
         # Prepare metadata
         if source_metadata is None:
             source_metadata = {"source": "unknown"}
-            
+
+        if self.structure_aware:
+            return _structured_chunk(raw_text, source_metadata, self.chunk_size, self.chunk_overlap)
+
+        chunks = self.text_splitter.split_text(raw_text)
+
         metadatas = []
         for i, chunk in enumerate(chunks):
             meta = source_metadata.copy()
             meta["chunk_index"] = i
             metadatas.append(meta)
-            
+
         return chunks, metadatas
+
+    def parse_and_chunk_files(self, documents: List[Tuple[str, Dict[str, Any]]], max_workers: Optional[int] = None) -> List[tuple[List[str], List[Dict[str, Any]]]]:
+        """
+        Chunk many saved OCR text files, given as (path, source_metadata) pairs, e.g.
+        for bulk imports. Results keep the input order.
+        Structure-aware chunking can run on a process pool (experimental). With
+        max_workers > 1 the pool is used as requested; with max_workers=None it is
+        only used above PARALLEL_MIN_CHARS / PARALLEL_MIN_WORKERS, which are not yet
+        tuned on multi-core machines. Workers read the files themselves and send
+        back only chunk metadata, because pickling the text to a worker costs about
+        as much as chunking it (see scripts/bench_chunker.py).
+        """
+        texts = []
+        for path, _ in documents:
+            with open(path, "r", encoding="utf-8") as f:
+                texts.append(f.read())
+
+        if max_workers is None:
+            max_workers = min(len(documents), os.cpu_count() or 1)
+            use_pool = max_workers >= PARALLEL_MIN_WORKERS and sum(len(text) for text in texts) >= PARALLEL_MIN_CHARS
+        else:
+            use_pool = max_workers > 1
+        if not self.structure_aware or not use_pool:
+            return [self.parse_and_chunk(text, meta) for text, (_, meta) in zip(texts, documents)]
+
+        jobs = [(path, meta, self.chunk_size, self.chunk_overlap) for path, meta in documents]
+        with ProcessPoolExecutor(max_workers=max_workers) as pool:
+            all_metadatas = list(pool.map(_chunk_file_job, jobs))
+
+        # The chunk text is sliced here from the offsets the workers computed
+        results = []
+        for text, metadatas in zip(texts, all_metadatas):
+            results.append(([text[m["char_start"]:m["char_end"]] for m in metadatas], metadatas))
+        return results
+
+
+def _chunk_file_job(job: tuple) -> List[Dict[str, Any]]:
+    """Process pool entry point (must be module-level to be picklable)."""
+    path, source_metadata, chunk_size, chunk_overlap = job
+    with open(path, "r", encoding="utf-8") as f:
+        raw_text = f.read()
+    if not raw_text.strip():
+        return []
+    if source_metadata is None:
+        source_metadata = {"source": "unknown"}
+    return _structured_chunk(raw_text, source_metadata, chunk_size, chunk_overlap)[1]
+
+
+def _scan(text: str) -> tuple:
+    """
+    Locate pages, headings and tables with one regex pass. Returns
+    (pages, boundaries, heading_starts, heading_titles, tables):
+    - pages: (page_number, start, end) spans; text without markers is one page-less span
+    - boundaries: positions where a heading or table starts or a table ends,
+      the preferred chunk boundaries
+    - heading_starts / heading_titles: parallel lists, one entry per heading line
+    - tables: (start, end) of each run of table rows
+    """
+    pages, boundaries, heading_starts, heading_titles, tables = [], [], [], [], []
+    page, page_start = None, 0
+
+    first = ELEMENT_AT_START_RE.match(text)
+    matches = [first] if first else []
+    matches.extend(ELEMENT_RE.finditer(text, first.end() if first else 0))
+    for m in matches:
+        # ELEMENT_RE matches include the newline before the element
+        s = m.start() if m is first else m.start() + 1
+        if m.group("page") is not None:
+            if page is not None or NON_SPACE_RE.search(text, page_start, s):
+                pages.append((page, page_start, s))
+            page, page_start = int(m.group("page")), m.end()
+        elif m.group("title") is not None:
+            boundaries.append(s)
+            heading_starts.append(s)
+            heading_titles.append(m.group("title"))
+        else:
+            boundaries.append(s)
+            boundaries.append(m.end())
+            tables.append((s, m.end()))
+    pages.append((page, page_start, len(text)))
+    return pages, boundaries, heading_starts, heading_titles, tables
+
+
+def _overlap_start(text: str, start: int, end: int, chunk_overlap: int) -> int:
+    """
+    Start of the longest tail of text[start:end] within chunk_overlap characters
+    that begins at a line, sentence or word boundary. Returns end if there is none.
+    """
+    window = max(start + 1, end - chunk_overlap)
+    for sep in ("\n", ". ", " "):
+        pos = text.find(sep, window, end)
+        if pos != -1:
+            pos += len(sep)
+            while pos < end and text[pos].isspace():
+                pos += 1
+            if pos < end:
+                return pos
+    return end
+
+
+def _split_page(text: str, start: int, end: int, chunk_size: int, chunk_overlap: int, structure: tuple) -> List[Tuple[int, int, Optional[str], str]]:
+    """
+    Greedy chunking of one page into (start, end, section, content_type) spans.
+    Each chunk is packed up to chunk_size and ends at the latest heading/table
+    boundary in its last quarter, else at a paragraph, line, sentence or word
+    boundary (in that order of preference). Table rows are lines, so tables are
+    only cut between rows. The next chunk starts with an overlap tail of the
+    previous one, except after a heading/table boundary. Only a few str.rfind
+    calls run per chunk.
+    """
+    boundaries, heading_starts, heading_titles, tables = structure
+    first = NON_SPACE_RE.search(text, start, end)
+    if not first:
+        return []
+    page_start = start = first.start()
+    while text[end - 1].isspace():
+        end -= 1
+
+    rfind = text.rfind
+    isspace = str.isspace
+    min_cut = chunk_size * 3 // 4
+    cuts = []
+    prev_end = start
+    b = 0  # first structural boundary after the chunk start
+    while end - start > chunk_size:
+        limit = start + chunk_size
+        # Don't accept a boundary that would make a small chunk or fail to advance
+        lowest = max(start + min_cut, prev_end + 1)
+        b = bisect.bisect_right(boundaries, start, b)
+        j = bisect.bisect_right(boundaries, limit, b)
+        at_boundary = j > b and boundaries[j - 1] > lowest
+        if at_boundary:
+            cut = boundaries[j - 1]
+        else:
+            for sep, keep in SPLIT_SEPARATORS:
+                cut = rfind(sep, lowest, limit)
+                if cut != -1:
+                    cut += keep
+                    break
+            else:
+                cut = limit
+        while isspace(text[cut - 1]) and cut > start:
+            cut -= 1
+        cuts.append((start, cut))
+        prev_end = cut
+
+        start = cut if at_boundary or not chunk_overlap else _overlap_start(text, start, cut, chunk_overlap)
+        while start < end and isspace(text[start]):
+            start += 1
+    if start < end:
+        cuts.append((start, end))
+
+    # Section: last heading of this page at or before the chunk start.
+    # Content type: "table" when table rows make up most of the chunk.
+    first_heading = bisect.bisect_left(heading_starts, page_start)
+    t = bisect.bisect_left(tables, (page_start,))
+    page_tables = tables[t:bisect.bisect_left(tables, (end,), t)]
+    spans = []
+    for s, e in cuts:
+        h = bisect.bisect_right(heading_starts, s)
+        section = heading_titles[h - 1] if h > first_heading else None
+        table_chars = 0
+        for t_start, t_end in page_tables:
+            if t_start < e and t_end > s:
+                table_chars += min(e, t_end) - max(s, t_start)
+        spans.append((s, e, section, "table" if table_chars * 2 > e - s else "text"))
+    return spans
+
+
+def _structured_chunk(raw_text: str, source_metadata: Dict[str, Any], chunk_size: int, chunk_overlap: int) -> tuple[List[str], List[Dict[str, Any]]]:
+    """
+    Page-, heading- and table-aware chunking. Every chunk is a contiguous slice
+    raw_text[char_start:char_end] that never crosses a page boundary; chunks
+    prefer to end where a heading or table starts, and tables are only cut
+    between rows.
+    """
+    pages, *structure = _scan(raw_text)
+    chunks = []
+    metadatas = []
+    for page, page_start, page_end in pages:
+        page_meta = source_metadata if page is None else {**source_metadata, "page": page}
+        for s, e, section, kind in _split_page(raw_text, page_start, page_end, chunk_size, chunk_overlap, structure):
+            meta = {**page_meta, "chunk_index": len(metadatas), "char_start": s, "char_end": e, "content_type": kind}
+            if section is not None:
+                meta["section"] = section
+            chunks.append(raw_text[s:e])
+            metadatas.append(meta)
+    return chunks, metadatas
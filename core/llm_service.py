@@ -2,6 +2,8 @@ from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain_core.messages import HumanMessage, SystemMessage
 from core.config import settings
 import sys
+import threading
+import time
 
 class LLMService:
     def __init__(self, provider: str = "gemini"):
@@ -34,13 +36,38 @@ class LLMService:
         if not self.llm:
             return "Error: LLM not initialized."
             
+        try:
+            return self.invoke(system_prompt, user_query)
+        except Exception as e:
+            return f"Error during generation: {e}"
+
+    def invoke(self, system_prompt: str, user_query: str) -> str:
+        """Like generate_response(), but raises on failure so callers can retry."""
+        if not self.llm:
+            raise RuntimeError("LLM not initialized.")
+
         messages = [
             SystemMessage(content=system_prompt),
             HumanMessage(content=user_query)
         ]
-        
-        try:
-            response = self.llm.invoke(messages)
-            return response.content
-        except Exception as e:
-            return f"Error during generation: {e}"
+        response = self.llm.invoke(messages)
+        return response.content
+
+
+class RateLimiter:
+    def __init__(self, requests_per_minute: float = 60):
+        """Thread-safe limiter that spaces calls evenly; 0 disables it."""
+        self.interval = 60.0 / requests_per_minute if requests_per_minute else 0.0
+        self._next_slot = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self):
+        """Block until the caller's request slot is reached."""
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
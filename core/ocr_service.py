@@ -44,8 +44,11 @@ class MistralOCRService:
             
             # Parse the text from response
             # Assuming the response object has pages as returned by mistralai
+            # PDFs get the same page markers as QwenVLService so chunks can keep page numbers
             extracted_text = ""
-            for page in response.pages:
+            for page_num, page in enumerate(response.pages):
+                if ext == "pdf":
+                    extracted_text += f"--- Page {page_num + 1} ---\n\n"
                 extracted_text += page.markdown + "\n\n"
                 
             return extracted_text.strip()
@@ -76,6 +79,9 @@ class QwenVLService:
                 device_map="auto"
             )
             self.processor = AutoProcessor.from_pretrained(self.model_id)
+
+            from core.page_preprocessor import PagePreprocessor, model_max_pixels
+            self.preprocessor = PagePreprocessor(max_pixels=model_max_pixels(self.processor), max_new_tokens=1024)
             print("Qwen3-VL Model loaded securely.")
             self.is_ready = True
         except ImportError:
@@ -93,7 +99,6 @@ class QwenVLService:
             import os
             
             ext = os.path.splitext(image_path)[1].lower()
-            images_to_process = []
             
             if ext == ".pdf":
                 try:
@@ -102,19 +107,32 @@ class QwenVLService:
                     print("PyMuPDF not installed. Cannot process PDF. Please run: pip install PyMuPDF")
                     return None
                     
-                doc = fitz.open(image_path)
-                for page_num in range(len(doc)):
-                    page = doc.load_page(page_num)
-                    # Use a relatively high resolution for better OCR
-                    pix = page.get_pixmap(matrix=fitz.Matrix(2, 2))
-                    img_data = pix.tobytes("png")
-                    import io
-                    images_to_process.append((Image.open(io.BytesIO(img_data)), f"Page {page_num + 1}"))
+                # Blank pages are skipped, repeated pages reuse earlier output, and each
+                # page gets its own render resolution and token budget
+                pages = self.preprocessor.prepare_pdf(image_path)
             else:
-                images_to_process.append((Image.open(image_path), "Image"))
+                pages = self.preprocessor.prepare_image(image_path)
+                
+            skipped = sum(1 for p in pages if p["status"] != "ok")
+            if skipped:
+                print(f"Preprocessing: skipping VLM inference for {skipped}/{len(pages)} blank or duplicate pages.")
                 
+            outputs = []
             full_text = ""
-            for img, label in images_to_process:
+            for page in pages:
+                label = page["label"]
+                if page["status"] == "blank":
+                    outputs.append("")
+                    if ext == ".pdf":
+                        full_text += f"\n\n--- {label} ---\n\n"
+                    continue
+                if page["status"] == "duplicate":
+                    outputs.append(outputs[page["duplicate_of"]])
+                    if ext == ".pdf":
+                        full_text += f"\n\n--- {label} ---\n\n" + outputs[-1]
+                    continue
+                    
+                img = page["image"]
                 # Construct message according to Qwen VL format
                 messages = [
                     {
@@ -142,7 +160,7 @@ class QwenVLService:
                 inputs = inputs.to(self.device)
                 
                 # Generation bounds
-                generated_ids = self.model.generate(**inputs, max_new_tokens=1024)
+                generated_ids = self.model.generate(**inputs, max_new_tokens=page["max_new_tokens"])
                 generated_ids_trimmed = [
                     out_ids[len(in_ids):] for in_ids, out_ids in zip(inputs.input_ids, generated_ids)
                 ]
@@ -151,6 +169,7 @@ class QwenVLService:
                     generated_ids_trimmed, skip_special_tokens=True, clean_up_tokenization_spaces=False
                 )
                 
+                outputs.append(output_text[0])
                 if ext == ".pdf":
                     full_text += f"\n\n--- {label} ---\n\n" + output_text[0]
                 else:
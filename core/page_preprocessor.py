@@ -0,0 +1,166 @@
+import hashlib
+import math
+from typing import List, Dict, Any
+from PIL import Image
+
+# Pixel budget used when the processor doesn't expose one (Qwen-VL default, ~1 MP)
+DEFAULT_MAX_PIXELS = 1280 * 28 * 28
+# Side length of the grayscale thumbnail used for the cheap statistics
+THUMB_SIZE = 256
+# How far from the background gray level a thumbnail pixel must be to count as "ink"
+# (either direction, so light text on dark pages counts too)
+INK_CONTRAST = 40
+# Ink ratio of ~10 lines of body text. Pages at or above it are OCR'd like the old
+# pipeline did (2x zoom, full token budget): a 30-line scan already sits around 0.12
+MODERATE_INK_RATIO = 0.04
+# Zoom used before per-page planning; denser pages never get less
+FULL_ZOOM = 2.0
+
+
+class PagePreprocessor:
+    def __init__(
+        self,
+        max_pixels: int = DEFAULT_MAX_PIXELS,
+        max_new_tokens: int = 1024,
+        min_new_tokens: int = 128,
+        blank_ink_ratio: float = 0.0002,
+    ):
+        """
+        Cheap, pre-inference page analysis for VLM OCR: skips blank pages,
+        dedupes repeated pages and picks a render size and token budget per page.
+        """
+        self.max_pixels = max_pixels
+        self.max_new_tokens = max_new_tokens
+        self.min_new_tokens = min_new_tokens
+        self.blank_ink_ratio = blank_ink_ratio
+
+    def prepare_pdf(self, pdf_path: str) -> List[Dict[str, Any]]:
+        """
+        Analyse every page of a PDF from a low-resolution grayscale thumbnail and
+        render only the pages that need OCR. Returns one plan dict per page:
+        {"label", "status": "ok" | "blank" | "duplicate", "image", "duplicate_of", "max_new_tokens"}.
+        """
+        import fitz  # PyMuPDF
+
+        plans = []
+        seen = {}  # digest of rendered pixels -> first page index
+        doc = fitz.open(pdf_path)
+        try:
+            for page_num in range(len(doc)):
+                page = doc.load_page(page_num)
+                rect = page.rect
+                thumb_scale = THUMB_SIZE / max(rect.width, rect.height)
+                pix = page.get_pixmap(matrix=fitz.Matrix(thumb_scale, thumb_scale), colorspace=fitz.csGRAY)
+                thumb = Image.frombytes("L", (pix.width, pix.height), pix.samples)
+
+                plan = self._plan_page(thumb, f"Page {page_num + 1}")
+                if plan["status"] == "ok":
+                    scale = self._render_scale(rect.width, rect.height, plan["ink_ratio"])
+                    pix = page.get_pixmap(matrix=fitz.Matrix(scale, scale))
+
+                    # Only byte-identical renders count as duplicates: pages from the same
+                    # template that differ in a number or amount must each be OCR'd.
+                    digest = hashlib.sha1(pix.samples).hexdigest() + f":{pix.width}x{pix.height}"
+                    if digest in seen:
+                        plan["status"] = "duplicate"
+                        plan["duplicate_of"] = seen[digest]
+                    else:
+                        seen[digest] = page_num
+                        # Use the PDF's own text layer as a density hint when it has one.
+                        # On pages with embedded images (scans) the text layer may be just a
+                        # stamp or Bates number, so the ink estimate still counts there.
+                        text_chars = len(page.get_text("text").strip())
+                        has_images = bool(page.get_images())
+                        plan["image"] = Image.frombytes("RGB", (pix.width, pix.height), pix.samples)
+                        plan["max_new_tokens"] = self._estimate_tokens(plan["ink_ratio"], text_chars, has_images)
+                plans.append(plan)
+        finally:
+            doc.close()
+        return plans
+
+    def prepare_image(self, image_path: str) -> List[Dict[str, Any]]:
+        """Single-image variant of prepare_pdf(). Images are only ever shrunk to the pixel budget."""
+        img = _flatten(Image.open(image_path))
+        thumb = img.convert("L")
+        thumb.thumbnail((THUMB_SIZE, THUMB_SIZE))
+
+        plan = self._plan_page(thumb, "Image")
+        if plan["status"] == "ok":
+            if img.width * img.height > self.max_pixels:
+                shrink = math.sqrt(self.max_pixels / (img.width * img.height))
+                img = img.resize((max(1, int(img.width * shrink)), max(1, int(img.height * shrink))), Image.LANCZOS)
+            plan["image"] = img
+            plan["max_new_tokens"] = self._estimate_tokens(plan["ink_ratio"], 0)
+        return [plan]
+
+    def _plan_page(self, thumb: Image.Image, label: str) -> Dict[str, Any]:
+        histogram = thumb.histogram()
+        total = thumb.width * thumb.height
+        # The most common gray level is the background, whatever its tint or darkness
+        background = max(range(256), key=histogram.__getitem__)
+        ink = sum(histogram[:max(0, background - INK_CONTRAST)]) + sum(histogram[background + INK_CONTRAST + 1:])
+        ink_ratio = ink / total if total else 0.0
+
+        plan = {
+            "label": label,
+            "status": "ok",
+            "image": None,
+            "duplicate_of": None,
+            "max_new_tokens": 0,
+            "ink_ratio": ink_ratio,
+        }
+
+        if ink_ratio < self.blank_ink_ratio:
+            plan["status"] = "blank"
+        return plan
+
+    def _render_scale(self, width: float, height: float, ink_ratio: float) -> float:
+        """
+        Zoom factor for a PDF page:
+        1. Moderate-or-denser pages keep the old 2x zoom.
+        2. Sparser pages shrink towards 1x (35% of the 2x area near blank).
+        3. Either way the model's pixel budget is a hard cap.
+        """
+        density = min(1.0, ink_ratio / MODERATE_INK_RATIO)
+        scale = max(1.0, FULL_ZOOM * math.sqrt(0.35 + 0.65 * density))
+        # PyMuPDF rounds each side up to a whole pixel, hence the +1
+        return min(scale, math.sqrt(self.max_pixels / ((width + 1) * (height + 1))))
+
+    def _estimate_tokens(self, ink_ratio: float, text_chars: int, has_images: bool = False) -> int:
+        """
+        Rough output length. With a text layer: ~3 chars per token plus markdown overhead.
+        Without one (scans) ink only tells us so much, so stay conservative: moderate-or-denser
+        pages get the full max_new_tokens and sparser ones scale down from it. Pages with
+        embedded images take the larger of the two.
+        """
+        ink_estimate = int(self.max_new_tokens * min(1.0, ink_ratio / MODERATE_INK_RATIO)) + 128
+        if not text_chars:
+            estimate = ink_estimate
+        else:
+            estimate = int(text_chars / 3 * 1.5) + 64
+            if has_images:
+                estimate = max(estimate, ink_estimate)
+        return max(self.min_new_tokens, min(self.max_new_tokens, estimate))
+
+
+def model_max_pixels(processor) -> int:
+    """Read the pixel budget from a Qwen-VL processor, falling back to DEFAULT_MAX_PIXELS."""
+    image_processor = getattr(processor, "image_processor", None)
+    budget = getattr(image_processor, "max_pixels", None)
+    size = getattr(image_processor, "size", None)
+    if not budget and isinstance(size, dict):
+        budget = size.get("max_pixels") or size.get("longest_edge")
+    return budget or DEFAULT_MAX_PIXELS
+
+
+def _flatten(img: Image.Image) -> Image.Image:
+    """Composite transparent images onto white, so a transparent background doesn't read as black."""
+    if img.mode == "P" and "transparency" in img.info:
+        img = img.convert("RGBA")
+    if img.mode in ("RGBA", "LA"):
+        background = Image.new("RGB", img.size, (255, 255, 255))
+        background.paste(img, mask=img.getchannel("A"))
+        return background
+    img.load()
+    return img
+
@@ -1,9 +1,16 @@
-from typing import List, Dict, Any
+import os
+import json
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import List, Dict, Any, Iterator, Tuple
 from core.ocr_service import MistralOCRService, QwenVLService
 from core.embed_service import EmbedService
 from core.vdb_service import VDBService
 from core.document_parser import DocumentParser
-from core.llm_service import LLMService
+from core.llm_service import LLMService, RateLimiter
+from core.conversation import ConversationState, truncate_to_tokens
+from core.config import settings
+
+NO_CONTEXT_ANSWER = "Xin lỗi, tôi không tìm thấy thông tin nào phù hợp trong tài liệu."
 
 class RagPipeline:
     def __init__(self, use_local_vlm=False):
@@ -18,11 +25,13 @@ class RagPipeline:
             self.ocr = MistralOCRService()
 
         self.embedder = EmbedService(model_name="BAAI/bge-m3")
-        self.vdb = VDBService(collection_name="smart_doc_qa")
-        self.parser = DocumentParser(chunk_size=1000, chunk_overlap=200)
+        self.vdb = VDBService(collection_name=settings.qdrant_collection)
+        self.parser = DocumentParser(chunk_size=1000, chunk_overlap=200, structure_aware=settings.structure_aware_chunking)
         self.llm_service = LLMService(provider="gemini")
+        # Bumped on every ingest/delete; part of the retrieval scope so cached chunks go stale
+        self.corpus_version = 0
         
-    def ingest_document(self, file_path: str, source_name: str) -> bool:
+    def ingest_document(self, file_path: str, source_name: str, tenant: str = None) -> bool:
         """
         End-to-end ingestion pipeline:
         1. OCR Image/PDF -> Text
@@ -31,40 +40,95 @@ class RagPipeline:
         4. Store in VectorDB
         """
         print(f"--- Starting Ingestion for {source_name} ---")
+        # Fail on an invalid tenant before spending time on OCR
+        tenant = self.vdb.resolve_tenant(tenant)
         
         # 1. OCR Extraction
+        text = self._extract_and_save(file_path, source_name, tenant)
+        if not text:
+            return False
+        
+        # 2. Chunking
+        chunks, metadatas = self.parser.parse_and_chunk(text, source_metadata={"source": source_name})
+        
+        # 3-4. Embedding & Storage
+        if not self._store_chunks(chunks, metadatas, tenant):
+            return False
+        
+        print("--- Ingestion Complete ---")
+        return True
+
+    def ingest_documents(self, files: List[Tuple[str, str]], tenant: str = None, chunk_workers: int = None) -> Dict[str, bool]:
+        """
+        Bulk variant of ingest_document() for (file_path, source_name) pairs.
+        OCR runs per file; the saved OCR texts are then chunked together.
+        chunk_workers > 1 chunks on a process pool (experimental, structure-aware
+        chunking only; see DocumentParser.parse_and_chunk_files).
+        Returns {source_name: success}.
+        """
+        tenant = self.vdb.resolve_tenant(tenant)
+        results = {}
+        saved = []
+        for file_path, source_name in files:
+            print(f"--- OCR for {source_name} ---")
+            if self._extract_and_save(file_path, source_name, tenant):
+                saved.append((self.ocr_path(source_name, tenant), {"source": source_name}))
+            else:
+                results[source_name] = False
+
+        chunked = self.parser.parse_and_chunk_files(saved, max_workers=chunk_workers)
+        for (_, meta), (chunks, metadatas) in zip(saved, chunked):
+            print(f"--- Storing {meta['source']} ---")
+            results[meta["source"]] = self._store_chunks(chunks, metadatas, tenant)
+
+        print(f"--- Bulk Ingestion Complete: {sum(results.values())}/{len(files)} documents ---")
+        return results
+
+    def upload_path(self, source_name: str, tenant: str = None) -> str:
+        """Where the original upload of a document is kept; each tenant has its own directory."""
+        return os.path.join("data", "tenants", self.vdb.resolve_tenant(tenant), "uploaded_docs", source_name)
+
+    def ocr_path(self, source_name: str, tenant: str = None) -> str:
+        """Where the OCR text of a document is kept; each tenant has its own directory."""
+        return os.path.join("data", "tenants", self.vdb.resolve_tenant(tenant), "ocr_results", f"{source_name}.txt")
+
+    def _extract_and_save(self, file_path: str, source_name: str, tenant: str = None) -> str:
+        """OCR a document and save the text locally for later viewing. Returns the text, or None."""
         text = self.ocr.extract_text(file_path)
         if not text:
             print("Failed to extract text from document.")
-            return False
+            return None
             
         print(f"OCR extracted {len(text)} characters.")
         
-        # Save OCR text locally for later viewing
-        import os
-        os.makedirs("data/ocr_results", exist_ok=True)
-        ocr_path = f"data/ocr_results/{source_name}.txt"
+        ocr_path = self.ocr_path(source_name, tenant)
+        os.makedirs(os.path.dirname(ocr_path), exist_ok=True)
         with open(ocr_path, "w", encoding="utf-8") as f:
             f.write(text)
-        
-        # 2. Chunking
-        chunks, metadatas = self.parser.parse_and_chunk(text, source_metadata={"source": source_name})
+        return text
+
+    def _store_chunks(self, chunks: List[str], metadatas: List[Dict[str, Any]], tenant: str = None) -> bool:
+        """Embed chunks and store them in the VectorDB."""
         if not chunks:
             print("No text chunks generated.")
             return False
             
         print(f"Created {len(chunks)} chunks.")
         
-        # 3. Embedding
         dense_vectors = self.embedder.embed_text(chunks)
-        
-        # 4. Storage
-        self.vdb.upsert_chunks(chunks, dense_vectors, metadatas)
-        
-        print("--- Ingestion Complete ---")
+        self.vdb.upsert_chunks(chunks, dense_vectors, metadatas, tenant=tenant)
+        self.corpus_version += 1
         return True
+
+    def delete_document(self, source_name: str, tenant: str = None):
+        """Delete a document's chunks from the VectorDB, plus this tenant's saved upload and OCR text."""
+        self.vdb.delete_document(source_name, tenant=tenant)
+        self.corpus_version += 1
+        for path in (self.upload_path(source_name, tenant), self.ocr_path(source_name, tenant)):
+            if os.path.exists(path):
+                os.remove(path)
         
-    def ask(self, query: str, allowed_sources: List[str] = None) -> str:
+    def ask(self, query: str, allowed_sources: List[str] = None, allowed_pages: List[int] = None, tenant: str = None) -> str:
         """
         End-to-end QA Pipeline:
         1. Embed user query
@@ -76,30 +140,253 @@ class RagPipeline:
         query_vector = self.embedder.embed_text([query])[0]
         
         # 2. Retrieve context from Qdrant
-        search_results = self.vdb.search(query_vector, limit=4, allowed_sources=allowed_sources)
+        search_results = self.vdb.search(query_vector, limit=4, allowed_sources=allowed_sources, allowed_pages=allowed_pages, tenant=tenant)
         
         if not search_results:
-            return "Xin lỗi, tôi không tìm thấy thông tin nào phù hợp trong tài liệu."
-            
-        # Combine context
-        context_parts = []
-        for i, res in enumerate(search_results):
-            text = res.get("text", "")
-            source = res.get("metadata", {}).get("source", "unknown")
-            context_parts.append(f"--- Đoạn {i+1} (Nguồn: {source}) ---\n{text}")
+            return NO_CONTEXT_ANSWER
             
-        context_str = "\n\n".join(context_parts)
-        
         # 3. Build prompt template
-        system_prompt = (
+        system_prompt = self._build_system_prompt(search_results)
+        
+        # 4. Generate answer
+        answer = self.llm_service.generate_response(system_prompt=system_prompt, user_query=query)
+        
+        return answer
+
+    @staticmethod
+    def _format_chunk(i: int, res: Dict[str, Any]) -> str:
+        text = res.get("text", "")
+        source = res.get("metadata", {}).get("source", "unknown")
+        page = res.get("metadata", {}).get("page")
+        if page is not None:
+            source = f"{source}, trang {page}"
+        return f"--- Đoạn {i+1} (Nguồn: {source}) ---\n{text}"
+
+    def _build_system_prompt(self, search_results: List[Dict[str, Any]]) -> str:
+        # Combine context
+        context_str = "\n\n".join(self._format_chunk(i, res) for i, res in enumerate(search_results))
+        return (
             "Bạn là một trợ lý AI phân tích tài liệu thông minh. "
             "Dựa trên các đoạn ngữ cảnh (context) được cung cấp dưới đây, hãy trả lời câu hỏi của người dùng. "
             "Nếu thông tin không có trong ngữ cảnh, hãy nói rõ là bạn không biết dựa trên tài liệu, đừng tự bịa thêm.\n\n"
             "NGỮ CẢNH TÀI LIỆU:\n"
             f"{context_str}"
         )
-        
-        # 4. Generate answer
-        answer = self.llm_service.generate_response(system_prompt=system_prompt, user_query=query)
-        
+
+    def ask_conversational(self, query: str, conversation: ConversationState, allowed_sources: List[str] = None, allowed_pages: List[int] = None, tenant: str = None) -> str:
+        """
+        Conversation-aware QA Pipeline:
+        1. Condense summary + recent turns + follow-up into a standalone query
+        2. Reuse the conversation's cached chunks unless the query drifted
+        3. Build prompt with a token-budgeted summary instead of the full transcript
+        4. Generate answer and fold old turns into the rolling summary
+        """
+        # 1. Standalone query (first turn is already standalone)
+        standalone = query
+        if conversation.has_history():
+            standalone = self._condense_query(conversation, query)
+        query_vector = self.embedder.embed_text([standalone])[0]
+
+        # 2. Retrieval reuse (only while no document was added or deleted since)
+        scope = (
+            self.corpus_version,
+            tenant,
+            tuple(sorted(allowed_sources)) if allowed_sources is not None else None,
+            tuple(sorted(allowed_pages)) if allowed_pages else None,
+        )
+        search_results = conversation.cached_results(query_vector, scope)
+        if search_results is None:
+            search_results = self.vdb.search(query_vector, limit=4, allowed_sources=allowed_sources, allowed_pages=allowed_pages, tenant=tenant)
+            # An empty result is not reused: the document may be uploaded before the next question
+            if search_results:
+                conversation.remember_results(query_vector, scope, search_results)
+
+        if not search_results:
+            answer = NO_CONTEXT_ANSWER
+        else:
+            # 3. Prompt with bounded conversation memory
+            system_prompt = self._build_system_prompt(search_results)
+            memory = []
+            if conversation.summary:
+                memory.append(f"Tóm tắt: {conversation.summary}")
+            if conversation.turns:
+                memory.append(conversation.transcript())
+            if memory:
+                system_prompt += "\n\nHỘI THOẠI TRƯỚC ĐÓ:\n" + "\n".join(memory)
+
+            # 4. Generate answer
+            answer = self.llm_service.generate_response(system_prompt=system_prompt, user_query=standalone)
+
+        conversation.add_turn(query, answer)
+        if conversation.needs_compaction():
+            self._compact_history(conversation)
         return answer
+
+    def _condense_query(self, conversation: ConversationState, query: str) -> str:
+        """Rewrite a follow-up question into a standalone one, bounded to the query token budget."""
+        history = conversation.transcript()
+        if conversation.summary:
+            history = f"Tóm tắt: {conversation.summary}\n{history}"
+        system_prompt = (
+            "Dựa vào lịch sử hội thoại, hãy viết lại câu hỏi tiếp theo của người dùng thành một câu hỏi "
+            "độc lập, đầy đủ ý, bằng cùng ngôn ngữ. Chỉ trả về câu hỏi, không trả lời nó.\n\n"
+            f"LỊCH SỬ HỘI THOẠI:\n{history}"
+        )
+        try:
+            standalone = self.llm_service.invoke(system_prompt, query).strip()
+        except Exception as e:
+            print(f"Query condensation failed, using raw follow-up: {e}")
+            last_user = conversation.turns[-1][0] if conversation.turns else ""
+            standalone = f"{last_user} {query}".strip()
+        return truncate_to_tokens(standalone or query, conversation.query_token_budget)
+
+    def _compact_history(self, conversation: ConversationState):
+        """Fold all but the most recent turns into the rolling summary."""
+        keep = conversation.recent_turn_count()
+        old_turns = conversation.turns[:-keep]
+        system_prompt = (
+            "Cập nhật bản tóm tắt hội thoại dưới đây bằng các lượt hỏi đáp mới. "
+            "Giữ lại chủ đề, tài liệu, điều khoản và số liệu đã được nhắc tới. "
+            f"Tối đa {conversation.summary_token_budget * 3} ký tự, chỉ trả về bản tóm tắt.\n\n"
+            f"TÓM TẮT HIỆN TẠI:\n{conversation.summary or '(trống)'}"
+        )
+        try:
+            summary = self.llm_service.invoke(system_prompt, conversation.transcript(old_turns)).strip()
+        except Exception as e:
+            print(f"History summarization failed, keeping latest questions only: {e}")
+            summary = " ".join(filter(None, [conversation.summary] + [user for user, _ in old_turns]))
+        conversation.summary = truncate_to_tokens(summary, conversation.summary_token_budget)
+        conversation.turns = conversation.turns[-keep:]
+
+    def ask_batch(
+        self,
+        questions: List[Any],
+        allowed_sources: List[str] = None,
+        allowed_pages: List[int] = None,
+        tenant: str = None,
+        max_workers: int = 4,
+        requests_per_minute: float = 60,
+        output_path: str = None,
+        search_batch_size: int = 64,
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        Answer many questions against the same document scope.
+        1. Embed all questions in one batch
+        2. Retrieve context with Qdrant batch queries
+        3. Build each distinct context (same retrieved chunks) only once
+        4. Generate answers through a bounded, rate-limited thread pool
+
+        Questions are strings or {"id", "question"} dicts; string ids default to
+        their position. Results are yielded as they complete. With output_path they
+        are also appended as JSONL, and ids already answered there are skipped, so
+        an interrupted run can simply be restarted.
+        """
+        items = []
+        for i, q in enumerate(questions):
+            if isinstance(q, dict):
+                items.append({"id": str(q.get("id", i)), "question": q["question"]})
+            else:
+                items.append({"id": str(i), "question": q})
+
+        done_ids = _load_answered_ids(output_path) if output_path else set()
+        pending = [item for item in items if item["id"] not in done_ids]
+        if done_ids:
+            print(f"Resuming batch: {len(items) - len(pending)}/{len(items)} questions already answered.")
+        if not pending:
+            return
+        # Blank questions aren't searched; they get an error record instead
+        searchable = [item for item in pending if item["question"].strip()]
+
+        # 1. Embed all questions at once
+        query_vectors = self.embedder.embed_text([item["question"] for item in searchable]) if searchable else []
+
+        # 2. Batched retrieval
+        all_results = []
+        for start in range(0, len(query_vectors), search_batch_size):
+            all_results.extend(self.vdb.search_batch(
+                query_vectors[start:start + search_batch_size],
+                limit=4,
+                allowed_sources=allowed_sources,
+                allowed_pages=allowed_pages,
+                tenant=tenant
+            ))
+
+        # 3. Questions retrieving the same chunks share one prompt
+        prompt_cache = {}
+        jobs = [(item, None, []) for item in pending if not item["question"].strip()]
+        for item, search_results in zip(searchable, all_results):
+            sources = sorted({res.get("metadata", {}).get("source", "unknown") for res in search_results})
+            if not search_results:
+                jobs.append((item, None, sources))
+                continue
+            key = tuple(res["id"] for res in search_results)
+            if key not in prompt_cache:
+                prompt_cache[key] = self._build_system_prompt(search_results)
+            jobs.append((item, prompt_cache[key], sources))
+        print(f"Batch of {len(jobs)} questions uses {len(prompt_cache)} distinct contexts.")
+
+        # 4. Concurrent, rate-limited generation
+        limiter = RateLimiter(requests_per_minute)
+
+        def answer(job):
+            item, system_prompt, sources = job
+            result = {"id": item["id"], "question": item["question"], "sources": sources}
+            # No "answer" key on failure: a resumed run will retry this question
+            if not item["question"].strip():
+                result["error"] = "Empty question."
+                return result
+            if system_prompt is None:
+                # The document may be uploaded before the next run
+                result["error"] = NO_CONTEXT_ANSWER
+                return result
+            try:
+                limiter.wait()
+                result["answer"] = self.llm_service.invoke(system_prompt, item["question"])
+            except Exception as e:
+                result["error"] = str(e)
+            return result
+
+        out = _open_results(output_path) if output_path else None
+        pool = ThreadPoolExecutor(max_workers=max_workers)
+        try:
+            for future in as_completed([pool.submit(answer, job) for job in jobs]):
+                result = future.result()
+                if out:
+                    out.write(json.dumps(result, ensure_ascii=False) + "\n")
+                    out.flush()
+                yield result
+        finally:
+            # Closing the generator early or Ctrl-C drops the queued LLM calls
+            # instead of waiting for answers nobody will read
+            pool.shutdown(wait=False, cancel_futures=True)
+            if out:
+                out.close()
+
+
+def _open_results(output_path: str):
+    """Open a JSONL results file for appending, first ending a line truncated by a killed run."""
+    if os.path.exists(output_path) and os.path.getsize(output_path):
+        with open(output_path, "rb") as f:
+            f.seek(-1, os.SEEK_END)
+            truncated = f.read(1) != b"\n"
+        if truncated:
+            with open(output_path, "a", encoding="utf-8") as f:
+                f.write("\n")
+    return open(output_path, "a", encoding="utf-8")
+
+
+def _load_answered_ids(output_path: str) -> set:
+    """Ids that already have an answer in a JSONL results file."""
+    done = set()
+    if not os.path.exists(output_path):
+        return done
+    with open(output_path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # A run killed mid-write can leave a truncated last line
+                continue
+            if "answer" in record:
+                done.add(str(record.get("id")))
+    return done
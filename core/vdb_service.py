@@ -1,14 +1,36 @@
+import re
 import uuid
 from typing import List, Dict, Any, Optional
 from qdrant_client import QdrantClient
-from qdrant_client.models import Distance, VectorParams, PointStruct, Filter, FieldCondition, MatchValue, MatchAny
+from qdrant_client.models import (
+    Distance, VectorParams, PointStruct, Filter, FieldCondition, MatchValue, MatchAny,
+    HnswConfigDiff, KeywordIndexParams, KeywordIndexType, IsEmptyCondition, PayloadField, QueryRequest,
+)
 from core.config import settings
 
+TENANT_FIELD = "tenant_id"
+TENANT_MODES = ("payload", "collection")
+# Payload mode: per-tenant HNSW graphs only, no global graph spanning every tenant
+TENANT_HNSW_CONFIG = HnswConfigDiff(payload_m=16, m=0)
+
+
 class VDBService:
-    def __init__(self, collection_name: str = "smart_doc_qa"):
+    def __init__(self, collection_name: str = "smart_doc_qa", tenant_mode: Optional[str] = None, default_tenant: Optional[str] = None):
+        """
+        tenant_mode selects how tenants are isolated:
+        - "payload": one collection, points tagged with tenant_id, which is indexed
+          with is_tenant=True so Qdrant keeps each tenant's points in their own segments.
+        - "collection": one collection per tenant. The default tenant keeps the base
+          collection, so data stored before multi-tenancy stays reachable.
+        """
         self.collection_name = collection_name
-        
+        self.tenant_mode = tenant_mode or settings.tenant_mode
+        self.default_tenant = default_tenant or settings.default_tenant
+        if self.tenant_mode not in TENANT_MODES:
+            raise ValueError(f"Unknown tenant_mode '{self.tenant_mode}', expected one of {TENANT_MODES}.")
+
         # Connect to local Qdrant memory/disk or URL if specified
+        self.local_mode = False
         if "localhost" in settings.qdrant_url:
             # We can use memory mode for dev or connect to local docker
             print(f"Connecting to Local Qdrant: {settings.qdrant_url}")
@@ -19,47 +41,143 @@ class VDBService:
             except Exception:
                 print("Local Qdrant Server not found, falling back to memory/disk mode.")
                 self.client = QdrantClient(path="./data/qdrant_storage")
+                self.local_mode = True
         else:
             self.client = QdrantClient(
                 url=settings.qdrant_url,
                 api_key=settings.qdrant_api_key
             )
-            
-        self._ensure_collection()
-        
+
+        # Collections already checked/created in this process
+        self._ready_collections = set()
+        self._ensure_collection(self.collection_name)
+
+        if self.tenant_mode == "payload":
+            self._tag_untenanted_points()
+
+    def resolve_tenant(self, tenant: Optional[str]) -> str:
+        """Tenant id to use (default tenant for None). Raises ValueError for ids outside [A-Za-z0-9_-]{1,64}."""
+        tenant = tenant or self.default_tenant
+        if not re.fullmatch(r"[A-Za-z0-9_-]{1,64}", tenant):
+            raise ValueError(f"Invalid tenant id '{tenant}'. Use letters, digits, '_' or '-'.")
+        return tenant
+
+    def _collection_for(self, tenant: str) -> str:
+        """Name of the collection holding a tenant's points."""
+        if self.tenant_mode == "payload" or tenant == self.default_tenant:
+            return self.collection_name
+        return f"{self.collection_name}__{tenant}"
+
+    def _route(self, tenant: Optional[str], create: bool = False) -> tuple[Optional[str], List[FieldCondition]]:
+        """
+        Resolve a tenant to (collection name, filter conditions scoping it).
+        Returns (None, []) when the tenant has no collection yet and create is False.
+        """
+        tenant = self.resolve_tenant(tenant)
+        collection = self._collection_for(tenant)
+
+        if self.tenant_mode == "payload":
+            return collection, [FieldCondition(key=TENANT_FIELD, match=MatchValue(value=tenant))]
+
+        if create:
+            self._ensure_collection(collection)
+        elif collection not in self._ready_collections and not self.client.collection_exists(collection):
+            return None, []
+        return collection, []
+
+    def _ensure_collection(self, collection_name: str):
+        """Create collection if it doesn't exist. BAAI/bge-m3 default dimension is 1024."""
+        if collection_name in self._ready_collections:
+            return
+
+        if not self.client.collection_exists(collection_name):
+            print(f"Creating collection '{collection_name}' with dimension 1024...")
+            self.client.create_collection(
+                collection_name=collection_name,
+                vectors_config=VectorParams(size=1024, distance=Distance.COSINE),
+                hnsw_config=TENANT_HNSW_CONFIG if self.tenant_mode == "payload" else None,
+            )
+        elif self.tenant_mode == "payload" and not self.local_mode:
+            # Local mode has no HNSW index to reconfigure
+            self._ensure_tenant_hnsw(collection_name)
+
         # Ensure payload index for the source field (required for deletion/filtering)
         try:
             self.client.create_payload_index(
-                collection_name=self.collection_name,
+                collection_name=collection_name,
                 field_name="source",
                 field_schema="keyword"
             )
         except Exception:
             pass
-        
-    def _ensure_collection(self):
-        """Create collection if it doesn't exist. BAAI/bge-m3 default dimension is 1024."""
-        collections = self.client.get_collections().collections
-        exists = any(c.name == self.collection_name for c in collections)
-        
-        if not exists:
-            print(f"Creating collection '{self.collection_name}' with dimension 1024...")
-            self.client.create_collection(
+
+        # Page index lets searches be narrowed to specific pages of a document
+        try:
+            self.client.create_payload_index(
+                collection_name=collection_name,
+                field_name="page",
+                field_schema="integer"
+            )
+        except Exception:
+            pass
+
+        if self.tenant_mode == "payload":
+            try:
+                self.client.create_payload_index(
+                    collection_name=collection_name,
+                    field_name=TENANT_FIELD,
+                    field_schema=KeywordIndexParams(type=KeywordIndexType.KEYWORD, is_tenant=True)
+                )
+            except Exception:
+                pass
+
+        self._ready_collections.add(collection_name)
+
+    def _ensure_tenant_hnsw(self, collection_name: str):
+        """Switch a collection created before multi-tenancy to per-tenant HNSW graphs."""
+        try:
+            hnsw = self.client.get_collection(collection_name).config.hnsw_config
+            if hnsw.m != 0 or not hnsw.payload_m:
+                print(f"Switching '{collection_name}' to per-tenant HNSW graphs (Qdrant rebuilds the index in the background)...")
+                self.client.update_collection(collection_name=collection_name, hnsw_config=TENANT_HNSW_CONFIG)
+        except Exception as e:
+            print(f"Error updating HNSW config of '{collection_name}': {e}")
+
+    def _tag_untenanted_points(self):
+        """
+        Assign points stored before multi-tenancy to the default tenant.
+        Runs on every start, so the collection-wide update is skipped unless a
+        count finds untagged points (i.e. only on the first start after upgrading).
+        """
+        untagged = Filter(must=[IsEmptyCondition(is_empty=PayloadField(key=TENANT_FIELD))])
+        try:
+            if not self.client.count(collection_name=self.collection_name, count_filter=untagged, exact=True).count:
+                return
+            print(f"Assigning untagged points in '{self.collection_name}' to tenant '{self.default_tenant}'...")
+            self.client.set_payload(
                 collection_name=self.collection_name,
-                vectors_config=VectorParams(size=1024, distance=Distance.COSINE),
+                payload={TENANT_FIELD: self.default_tenant},
+                points=untagged
             )
-            
-    def upsert_chunks(self, chunks: List[str], embeddings_dense: List[List[float]], metadatas: Optional[List[Dict[str, Any]]] = None):
+        except Exception as e:
+            print(f"Error tagging legacy points with tenant: {e}")
+
+    def upsert_chunks(self, chunks: List[str], embeddings_dense: List[List[float]], metadatas: Optional[List[Dict[str, Any]]] = None, tenant: Optional[str] = None):
         """Insert extracted text chunks into Qdrant."""
         if metadatas is None:
             metadatas = [{"source": "unknown"} for _ in chunks]
-            
+
+        collection, _ = self._route(tenant, create=True)
+        tenant = self.resolve_tenant(tenant)
+
         points = []
         for i, (chunk, vector, meta) in enumerate(zip(chunks, embeddings_dense, metadatas)):
             # Tự thêm chunk text vào metadata để query có thể trả về
             meta_copy = meta.copy()
             meta_copy["text"] = chunk
-            
+            if self.tenant_mode == "payload":
+                meta_copy[TENANT_FIELD] = tenant
+
             points.append(
                 PointStruct(
                     id=str(uuid.uuid4()),
@@ -67,54 +185,97 @@ class VDBService:
                     payload=meta_copy
                 )
             )
-            
+
         self.client.upsert(
-            collection_name=self.collection_name,
+            collection_name=collection,
             points=points
         )
-        print(f"Upserted {len(points)} chunks into {self.collection_name}.")
-        
-    def search(self, query_vector: List[float], limit: int = 5, allowed_sources: Optional[List[str]] = None) -> List[Dict[str, Any]]:
-        """Search similar vectors and return the payload."""
-        search_filter = None
-        if allowed_sources is not None and len(allowed_sources) > 0:
-            search_filter = Filter(
-                must=[
-                    FieldCondition(
-                        key="source",
-                        match=MatchAny(any=allowed_sources)
-                    )
-                ]
-            )
-        elif allowed_sources is not None and len(allowed_sources) == 0:
+        print(f"Upserted {len(points)} chunks into {collection} (tenant: {tenant}).")
+
+    def _search_filter(self, tenant: Optional[str], allowed_sources: Optional[List[str]], allowed_pages: Optional[List[int]]) -> tuple[Optional[str], Optional[Filter]]:
+        """Collection and filter for a tenant-scoped search; collection is None when nothing can match."""
+        if allowed_sources is not None and len(allowed_sources) == 0:
             # If allowed_sources list is explicitly empty, return nothing
-            return []
-            
-        search_result = self.client.query_points(
-            collection_name=self.collection_name,
-            query=query_vector,
-            limit=limit,
-            query_filter=search_filter,
-            score_threshold=0.2 # Filter out completely irrelevant vectors
-        ).points
-        
+            return None, None
+
+        collection, conditions = self._route(tenant)
+        if collection is None:
+            return None, None
+
+        if allowed_sources:
+            conditions.append(
+                FieldCondition(
+                    key="source",
+                    match=MatchAny(any=allowed_sources)
+                )
+            )
+
+        if allowed_pages:
+            conditions.append(
+                FieldCondition(
+                    key="page",
+                    match=MatchAny(any=allowed_pages)
+                )
+            )
+        return collection, Filter(must=conditions) if conditions else None
+
+    @staticmethod
+    def _to_results(points) -> List[Dict[str, Any]]:
         results = []
-        for hit in search_result:
+        for hit in points:
             results.append({
+                "id": hit.id,
                 "score": hit.score,
                 "text": hit.payload.get("text", ""),
                 "metadata": hit.payload
             })
-            
         return results
 
-    def has_document(self, source_name: str) -> bool:
-        """Check if a document has already been processed and saved."""
+    def search(self, query_vector: List[float], limit: int = 5, allowed_sources: Optional[List[str]] = None, allowed_pages: Optional[List[int]] = None, tenant: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Search similar vectors within a tenant and return the payload."""
+        collection, search_filter = self._search_filter(tenant, allowed_sources, allowed_pages)
+        if collection is None:
+            return []
+
+        search_result = self.client.query_points(
+            collection_name=collection,
+            query=query_vector,
+            limit=limit,
+            query_filter=search_filter,
+            score_threshold=0.2 # Filter out completely irrelevant vectors
+        ).points
+
+        return self._to_results(search_result)
+
+    def search_batch(self, query_vectors: List[List[float]], limit: int = 5, allowed_sources: Optional[List[str]] = None, allowed_pages: Optional[List[int]] = None, tenant: Optional[str] = None) -> List[List[Dict[str, Any]]]:
+        """Run many searches with the same scope in a single Qdrant batch query request."""
+        collection, search_filter = self._search_filter(tenant, allowed_sources, allowed_pages)
+        if collection is None or not query_vectors:
+            return [[] for _ in query_vectors]
+
+        requests = [
+            QueryRequest(
+                query=vector,
+                filter=search_filter,
+                limit=limit,
+                score_threshold=0.2,
+                with_payload=True
+            )
+            for vector in query_vectors
+        ]
+        responses = self.client.query_batch_points(collection_name=collection, requests=requests)
+        return [self._to_results(response.points) for response in responses]
+
+    def has_document(self, source_name: str, tenant: Optional[str] = None) -> bool:
+        """Check if a document has already been processed and saved for a tenant."""
         try:
+            collection, conditions = self._route(tenant)
+            if collection is None:
+                return False
             result = self.client.count(
-                collection_name=self.collection_name,
+                collection_name=collection,
                 count_filter=Filter(
-                    must=[
+                    must=conditions + [
                         FieldCondition(
                             key="source",
                             match=MatchValue(value=source_name)
@@ -127,13 +288,16 @@ class VDBService:
             print(f"Error checking document existence: {e}")
             return False
 
-    def delete_document(self, source_name: str) -> bool:
-        """Delete all vectors associated with a specific document source."""
+    def delete_document(self, source_name: str, tenant: Optional[str] = None) -> bool:
+        """Delete all vectors associated with a specific document source of a tenant."""
         try:
+            collection, conditions = self._route(tenant)
+            if collection is None:
+                return True
             self.client.delete(
-                collection_name=self.collection_name,
+                collection_name=collection,
                 points_selector=Filter(
-                    must=[
+                    must=conditions + [
                         FieldCondition(
                             key="source",
                             match=MatchValue(value=source_name)
@@ -146,22 +310,61 @@ class VDBService:
             print(f"Error deleting document: {e}")
             return False
 
-    def get_all_documents(self) -> List[str]:
-        """Fetch all unique source document names from Qdrant."""
+    def get_all_documents(self, tenant: Optional[str] = None) -> List[str]:
+        """Fetch all unique source document names of a tenant from Qdrant."""
         try:
-            sources = set()
-            points, next_page_offset = self.client.scroll(
-                collection_name=self.collection_name,
-                limit=10000,
-                with_payload=["source"],
-                with_vectors=False
+            collection, conditions = self._route(tenant)
+            if collection is None:
+                return []
+            # Facet over the indexed source field instead of scrolling every point
+            response = self.client.facet(
+                collection_name=collection,
+                key="source",
+                facet_filter=Filter(must=conditions) if conditions else None,
+                limit=100000
             )
-            for point in points:
-                if point.payload:
-                    source = point.payload.get("source")
-                    if source and source != "unknown":
-                        sources.add(source)
-            return list(sources)
+            return [hit.value for hit in response.hits if hit.value and hit.value != "unknown"]
         except Exception as e:
             print(f"Error retrieving documents: {e}")
             return []
+
+    def list_tenants(self) -> List[str]:
+        """List tenants that have data stored."""
+        try:
+            if self.tenant_mode == "payload":
+                response = self.client.facet(
+                    collection_name=self.collection_name,
+                    key=TENANT_FIELD,
+                    limit=100000
+                )
+                return [str(hit.value) for hit in response.hits]
+
+            prefix = f"{self.collection_name}__"
+            tenants = [self.default_tenant]
+            for c in self.client.get_collections().collections:
+                if c.name.startswith(prefix):
+                    tenants.append(c.name[len(prefix):])
+            return tenants
+        except Exception as e:
+            print(f"Error listing tenants: {e}")
+            return []
+
+    def delete_tenant(self, tenant: str) -> bool:
+        """Remove every point of a tenant (and its collection in collection mode)."""
+        try:
+            tenant = self.resolve_tenant(tenant)
+            collection, conditions = self._route(tenant)
+            if collection is None:
+                return True
+            if self.tenant_mode == "collection" and collection != self.collection_name:
+                self.client.delete_collection(collection_name=collection)
+                self._ready_collections.discard(collection)
+            else:
+                self.client.delete(
+                    collection_name=collection,
+                    points_selector=Filter(must=conditions) if conditions else Filter(must=[])
+                )
+            return True
+        except Exception as e:
+            print(f"Error deleting tenant: {e}")
+            return False
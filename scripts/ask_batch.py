@@ -0,0 +1,63 @@
+"""
+Answer a list of questions against the stored documents and stream results as JSONL.
+
+Usage (from the project root):
+    python -m scripts.ask_batch questions.txt -o answers.jsonl
+    python -m scripts.ask_batch questions.jsonl -o answers.jsonl --sources contract.pdf --tenant acme
+
+questions.txt holds one question per line; questions.jsonl holds {"id", "question"} objects.
+Re-running with the same output file skips questions that already have an answer.
+"""
+import argparse
+import json
+from core.rag_pipeline import RagPipeline
+
+
+def load_questions(path: str) -> list:
+    questions = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            if path.endswith(".jsonl"):
+                questions.append(json.loads(line))
+            else:
+                questions.append(line)
+    return questions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Batch question answering over stored documents.")
+    parser.add_argument("questions", help="Text file (one question per line) or JSONL file with id/question")
+    parser.add_argument("-o", "--output", required=True, help="JSONL file results are appended to")
+    parser.add_argument("--sources", nargs="*", default=None, help="Restrict retrieval to these documents")
+    parser.add_argument("--tenant", default=None, help="Tenant to query (defaults to DEFAULT_TENANT)")
+    parser.add_argument("--workers", type=int, default=4, help="Concurrent LLM calls")
+    parser.add_argument("--rpm", type=float, default=60, help="LLM requests per minute (0 = unlimited)")
+    args = parser.parse_args()
+
+    questions = load_questions(args.questions)
+    pipeline = RagPipeline(use_local_vlm=False)
+
+    answered = 0
+    failed = 0
+    for result in pipeline.ask_batch(
+        questions,
+        allowed_sources=args.sources,
+        tenant=args.tenant,
+        max_workers=args.workers,
+        requests_per_minute=args.rpm,
+        output_path=args.output,
+    ):
+        if "answer" in result:
+            answered += 1
+        else:
+            failed += 1
+            print(f"Question {result['id']} failed: {result['error']}")
+
+    print(f"Done: {answered} answered, {failed} failed (re-run to retry). Results in {args.output}")
+
+
+if __name__ == "__main__":
+    main()
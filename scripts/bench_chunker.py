@@ -0,0 +1,103 @@
+"""
+Benchmark DocumentParser chunking on synthetic OCR output.
+
+Usage (from the project root):
+    python -m scripts.bench_chunker
+
+1. Structure-aware chunker vs LangChain's RecursiveCharacterTextSplitter: time,
+   chunk count and mean chunk size (chunk count drives embedding cost).
+2. parse_and_chunk_files() serial vs process pool. The pool overhead measured
+   here is what PARALLEL_MIN_CHARS in core/document_parser.py is derived from;
+   run it on multi-core machines to re-tune those experimental thresholds.
+"""
+import os
+import random
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from core.document_parser import DocumentParser, _chunk_file_job
+
+WORDS = "hợp đồng điều khoản thanh toán bên mua bên bán giá trị the contract payment clause invoice total amount".split()
+
+
+def make_document(pages: int, seed: int = 0) -> str:
+    """OCR-like text: page markers, headings, paragraphs, single-newline lines and tables."""
+    rng = random.Random(seed)
+    sentence = lambda n: " ".join(rng.choice(WORDS) for _ in range(n)) + "."
+    parts = []
+    for page in range(1, pages + 1):
+        parts.append(f"--- Page {page} ---\n")
+        parts.append(f"## Section {page}\n")
+        for _ in range(4):
+            parts.append(" ".join(sentence(rng.randint(8, 20)) for _ in range(rng.randint(2, 6))) + "\n")
+        parts.append("\n".join(sentence(8) for _ in range(15)) + "\n")
+        parts.append("| Item | Qty | Price |\n|---|---|---|\n" + "\n".join(f"| {sentence(3)} | {i} | {i * 10} |" for i in range(8)) + "\n")
+    return "\n".join(parts)
+
+
+def best_of(fn, repeat: int = 5) -> float:
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def bench_splitters():
+    print("== Structure-aware vs RecursiveCharacterTextSplitter (chunk_size=1000, overlap=200) ==")
+    structured = DocumentParser(1000, 200, structure_aware=True)
+    recursive = DocumentParser(1000, 200, structure_aware=False)
+    for pages in (10, 100, 1000, 5000):
+        text = make_document(pages)
+        t_rec = best_of(lambda: recursive.parse_and_chunk(text, {"source": "bench"}))
+        t_str = best_of(lambda: structured.parse_and_chunk(text, {"source": "bench"}))
+        n_rec = len(recursive.parse_and_chunk(text, {"source": "bench"})[0])
+        n_str = len(structured.parse_and_chunk(text, {"source": "bench"})[0])
+        print(
+            f"{len(text):>11,} chars | recursive {t_rec * 1000:8.1f} ms, {n_rec:>6} chunks (~{len(text) // n_rec} chars)"
+            f" | structured {t_str * 1000:8.1f} ms, {n_str:>6} chunks (~{len(text) // n_str} chars) | speed {t_rec / t_str:4.2f}x"
+        )
+
+
+def bench_pool():
+    print("\n== parse_and_chunk_files: serial vs process pool ==")
+    cpus = os.cpu_count() or 1
+    print(f"CPUs: {cpus}")
+    parser = DocumentParser(1000, 200, structure_aware=True)
+    with tempfile.TemporaryDirectory() as tmp:
+        for docs, pages in ((4, 10), (8, 50), (8, 200), (16, 500)):
+            documents = []
+            for seed in range(docs):
+                path = os.path.join(tmp, f"{pages}_{seed}.txt")
+                with open(path, "w", encoding="utf-8") as f:
+                    f.write(make_document(pages, seed))
+                documents.append((path, {"source": f"doc{seed}"}))
+            total = sum(os.path.getsize(path) for path, _ in documents)
+            jobs = [(path, meta, 1000, 200) for path, meta in documents]
+
+            t_serial = best_of(lambda: parser.parse_and_chunk_files(documents, max_workers=1))
+
+            # Same work as the pooled path in parse_and_chunk_files, but a 1-worker pool
+            # too (parse_and_chunk_files chunks serially for max_workers=1)
+            def pooled(workers):
+                with ProcessPoolExecutor(max_workers=workers) as pool:
+                    metadatas = list(pool.map(_chunk_file_job, jobs))
+                for (path, _), metas in zip(documents, metadatas):
+                    with open(path, "r", encoding="utf-8") as f:
+                        text = f.read()
+                    [text[m["char_start"]:m["char_end"]] for m in metas]
+
+            # On one worker the pool does all the serial work plus its own overhead
+            t_one = best_of(lambda: pooled(1))
+            line = f"{total:>11,} bytes | serial {t_serial * 1000:7.1f} ms | 1-worker pool {t_one * 1000:7.1f} ms (overhead {(t_one - t_serial) * 1000:+6.1f} ms)"
+            if cpus > 1:
+                # An explicit worker count bypasses the automatic (experimental) gate
+                t_all = best_of(lambda: parser.parse_and_chunk_files(documents, max_workers=min(cpus, docs)))
+                line += f" | {min(cpus, docs)}-worker pool {t_all * 1000:7.1f} ms"
+            print(line)
+
+
+if __name__ == "__main__":
+    bench_splitters()
+    bench_pool()
@@ -0,0 +1,125 @@
+"""
+Sanity checks for PagePreprocessor on generated pages (needs Pillow and PyMuPDF).
+
+Usage (from the project root):
+    python -m scripts.check_page_preprocessor
+"""
+import io
+import os
+import tempfile
+from types import SimpleNamespace
+import fitz  # PyMuPDF
+from PIL import Image, ImageDraw, ImageFont
+from core.page_preprocessor import PagePreprocessor, model_max_pixels
+
+# Qwen2.5-VL's processor default
+QWEN_MAX_PIXELS = 12845056
+
+
+def draw_lines(img: Image.Image, lines: int, fill):
+    draw = ImageDraw.Draw(img)
+    for i in range(lines):
+        draw.text((40, 40 + i * 30), f"Line {i + 1}: the quick brown fox jumps over the lazy dog", fill=fill)
+    return img
+
+
+def check_blank_detection(tmp: str, pp: PagePreprocessor):
+    white = os.path.join(tmp, "white.png")
+    Image.new("RGB", (800, 1000), "white").save(white)
+    assert pp.prepare_image(white)[0]["status"] == "blank", "white page should be blank"
+
+    dark = os.path.join(tmp, "dark.png")
+    draw_lines(Image.new("RGB", (800, 1000), (20, 20, 20)), 12, (240, 240, 240)).save(dark)
+    assert pp.prepare_image(dark)[0]["status"] == "ok", "white text on dark background is not blank"
+
+    transparent = os.path.join(tmp, "transparent.png")
+    draw_lines(Image.new("RGBA", (800, 1000), (0, 0, 0, 0)), 12, (0, 0, 0, 255)).save(transparent)
+    plan = pp.prepare_image(transparent)[0]
+    assert plan["status"] == "ok", "black text on transparent background is not blank"
+    assert plan["image"].mode == "RGB", "transparent images are flattened before OCR"
+
+    doc = fitz.open()
+    page = doc.new_page()
+    page.draw_rect(page.rect, color=(0.1, 0.1, 0.2), fill=(0.1, 0.1, 0.2))
+    for i in range(10):
+        page.insert_text((50, 80 + i * 20), f"Slide bullet {i}: white text on a dark fill", fontsize=12, color=(1, 1, 1))
+    doc.new_page()
+    slide = os.path.join(tmp, "slide.pdf")
+    doc.save(slide)
+    statuses = [p["status"] for p in pp.prepare_pdf(slide)]
+    assert statuses == ["ok", "blank"], f"dark slide / empty page: {statuses}"
+    print("blank detection: OK")
+
+
+def check_dedupe(tmp: str, pp: PagePreprocessor):
+    doc = fitz.open()
+    # Three invoices from one template that differ only in number and amount,
+    # then a truly repeated first page
+    for number, amount in (("INV-1001", "1,250.00"), ("INV-1002", "1,380.00"), ("INV-1003", "1,250.00"), ("INV-1001", "1,250.00")):
+        page = doc.new_page()
+        page.insert_text((50, 60), "ACME Corporation - Invoice", fontsize=16)
+        for i in range(20):
+            page.insert_text((50, 110 + i * 18), f"Item {i + 1}: consulting services, 1 unit", fontsize=10)
+        page.insert_text((50, 500), f"Invoice number: {number}   Total amount: {amount} USD", fontsize=9)
+    invoices = os.path.join(tmp, "invoices.pdf")
+    doc.save(invoices)
+
+    plans = pp.prepare_pdf(invoices)
+    statuses = [(p["status"], p["duplicate_of"]) for p in plans]
+    assert statuses == [("ok", None), ("ok", None), ("ok", None), ("duplicate", 0)], f"near-identical pages merged: {statuses}"
+    print("dedupe: OK")
+
+
+def check_scanned_budget(tmp: str):
+    # Qwen-VL's own pixel budget is used as-is, not capped below it
+    processor = SimpleNamespace(image_processor=SimpleNamespace(max_pixels=QWEN_MAX_PIXELS))
+    assert model_max_pixels(processor) == QWEN_MAX_PIXELS, "model pixel budget should not be capped"
+    pp = PagePreprocessor(max_pixels=QWEN_MAX_PIXELS)
+
+    # A 30-line A4 scan: the page is one image, so there is no text layer to go by
+    scan = Image.new("RGB", (1240, 1754), "white")
+    font = ImageFont.load_default(size=22)
+    draw = ImageDraw.Draw(scan)
+    for i in range(30):
+        draw.text((100, 100 + i * 50), f"{i + 1}. The parties agree that payment shall be made within thirty days", fill="black", font=font)
+    buffer = io.BytesIO()
+    scan.save(buffer, "PNG")
+    doc = fitz.open()
+    page = doc.new_page(width=595, height=842)
+    page.insert_image(page.rect, stream=buffer.getvalue())
+    scanned = os.path.join(tmp, "scanned.pdf")
+    doc.save(scanned)
+
+    plan = pp.prepare_pdf(scanned)[0]
+    assert plan["max_new_tokens"] == pp.max_new_tokens, f"dense scan got max_new_tokens={plan['max_new_tokens']}"
+    assert plan["image"].size == (1190, 1684), f"dense scan rendered at {plan['image'].size}, below 2x"
+
+    # The same scan with a one-line text stamp: the text layer must not shrink the budget
+    page.insert_text((400, 30), "Contract No. 12", fontsize=9)
+    stamped = os.path.join(tmp, "stamped.pdf")
+    doc.save(stamped)
+    plan = pp.prepare_pdf(stamped)[0]
+    assert plan["max_new_tokens"] == pp.max_new_tokens, f"stamped scan got max_new_tokens={plan['max_new_tokens']}"
+
+    # A born-digital page keeps the cheaper text-layer estimate
+    doc = fitz.open()
+    page = doc.new_page()
+    for i in range(5):
+        page.insert_text((50, 80 + i * 20), f"Short digital note, line {i + 1}", fontsize=11)
+    digital = os.path.join(tmp, "digital.pdf")
+    doc.save(digital)
+    plan = pp.prepare_pdf(digital)[0]
+    assert plan["max_new_tokens"] < pp.max_new_tokens // 2, f"short digital page got max_new_tokens={plan['max_new_tokens']}"
+
+    # A small model budget still wins over the 2x zoom
+    small = PagePreprocessor(max_pixels=1280 * 28 * 28).prepare_pdf(scanned)[0]["image"]
+    assert small.width * small.height <= 1280 * 28 * 28, f"render {small.size} exceeds the pixel budget"
+    print("scanned page budget: OK")
+
+
+if __name__ == "__main__":
+    preprocessor = PagePreprocessor()
+    with tempfile.TemporaryDirectory() as tmp:
+        check_blank_detection(tmp, preprocessor)
+        check_dedupe(tmp, preprocessor)
+        check_scanned_budget(tmp)
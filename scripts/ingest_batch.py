@@ -0,0 +1,44 @@
+"""
+Bulk-import documents: OCR each file, chunk all OCR texts together, then embed and store.
+
+Usage (from the project root):
+    python -m scripts.ingest_batch docs/*.pdf --tenant acme
+    python -m scripts.ingest_batch scans/*.png --local-vlm
+
+Documents already stored for the tenant are skipped.
+"""
+import argparse
+import os
+from core.rag_pipeline import RagPipeline
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk document ingestion.")
+    parser.add_argument("files", nargs="+", help="PDF / PNG / JPG files to ingest")
+    parser.add_argument("--tenant", default=None, help="Tenant to store into (defaults to DEFAULT_TENANT)")
+    parser.add_argument("--local-vlm", action="store_true", help="Use local Qwen-VL instead of Mistral OCR")
+    parser.add_argument("--chunk-workers", type=int, default=None, help="Chunk on a process pool with this many workers (experimental)")
+    args = parser.parse_args()
+
+    pipeline = RagPipeline(use_local_vlm=args.local_vlm)
+
+    files = []
+    for path in args.files:
+        source_name = os.path.basename(path)
+        if pipeline.vdb.has_document(source_name, tenant=args.tenant):
+            print(f"Skipping {source_name}: already stored.")
+            continue
+        files.append((path, source_name))
+
+    if not files:
+        print("Nothing to ingest.")
+        return
+
+    results = pipeline.ingest_documents(files, tenant=args.tenant, chunk_workers=args.chunk_workers)
+    for source_name, success in results.items():
+        if not success:
+            print(f"Failed: {source_name}")
+
+
+if __name__ == "__main__":
+    main()